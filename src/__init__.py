@@ -6,6 +6,10 @@ from src.colorlog import logger
 # Constants
 PREFIX = "AdBlock-DNS-Filters"
 CACHE_FILE = "cloudflare_cache.json"
+JOURNAL_FILE = "cloudflare_journal.jsonl"
+PLAN_FILE = "cloudflare_plan.json"
+APPLY_WORKERS = 4
+APPLY_BATCH_SIZE = 50
 
 # Read .env variables 
 def dot_env(file_path=".env"):
@@ -31,12 +35,18 @@ if not CF_API_TOKEN or not CF_IDENTIFIER or \
    CF_API_TOKEN == "your CF_API_TOKEN value" or \
    CF_IDENTIFIER == "your CF_IDENTIFIER value":
     raise Exception("Missing Cloudflare credentials")
+
+# Daemon polling interval (seconds) and local health/metrics port
+DAEMON_INTERVAL = int(os.getenv("DAEMON_INTERVAL") or env_vars.get("DAEMON_INTERVAL") or 3600)
+DAEMON_MIN_INTERVAL = 300
+DAEMON_PORT = int(os.getenv("DAEMON_PORT") or env_vars.get("DAEMON_PORT") or 8787)
        
 # Compile regex patterns
 ids_pattern = re.compile(r"\$([a-f0-9-]+)")
 ip_pattern = re.compile(r"^\d{1,3}(\.\d{1,3}){3,4}$")
 replace_pattern = re.compile(r"(^([0-9.]+|[0-9a-fA-F:.]+)\s+|^(\|\||@@\|\||\*\.|\*))")
 domain_pattern = re.compile(r"^(?!-)[a-zA-Z0-9-]{1,63}(?:\.(?!-)[a-zA-Z0-9-]{1,63})*$")
+max_age_pattern = re.compile(r"max-age=(\d+)")
 
 # Logging functions
 def error(message):
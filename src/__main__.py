@@ -1,10 +1,14 @@
 import argparse
+from src.daemon import Daemon
+from src.analyze import analyze_sources
 from src.domains import DomainConverter
-from src import utils, info, silent_error, error, PREFIX
-from src.cloudflare import (
-    create_list, update_list, create_rule, 
-    update_rule, delete_list, delete_rule
+from src.journal import Journal, resume
+from src.plan import (
+    build_plan, estimate_plan, save_plan, load_plan, apply_plan, state_digest
 )
+from src import utils, info, error, PREFIX
+from src.cloudflare import delete_list, delete_rule
+from src.requests import fatal_error
 
 
 class CloudflareManager:
@@ -13,95 +17,48 @@ class CloudflareManager:
         self.rule_name = f"[{prefix}] Block Ads"
         self.cache = utils.load_cache()
 
-    def update_resources(self):
-        domains_to_block = DomainConverter().process_urls()
-        if len(domains_to_block) > 300000:
-            error("The domains list exceeds Cloudflare Gateway's free limit of 300,000 domains.")
-        
-        current_lists = utils.get_current_lists(self.cache, self.list_name)
-        current_rules = utils.get_current_rules(self.cache, self.rule_name)
+        # Pick up where an interrupted sync stopped
+        self.journal = Journal()
+        if resume(self.cache, self.journal):
+            utils.save_cache(self.cache)
+            self.journal.clear()
 
-        # Mapping list_id to current domains in that list
-        list_id_to_domains = {}
-        for lst in current_lists:
-            items = utils.get_list_items_cached(self.cache, lst["id"])
-            list_id_to_domains[lst["id"]] = set(items)
-
-        # Mapping domain to its current list_id
-        domain_to_list_id = {domain: lst_id for lst_id, domains in list_id_to_domains.items() for domain in domains}
-
-        # Calculate remaining domains 
-        remaining_domains = set(domains_to_block) - set(domain_to_list_id.keys())
-
-        # Create a dictionary for list names to keep track of missing indexes
-        list_name_to_id = {lst["name"]: lst["id"] for lst in current_lists}
-        existing_indexes = sorted([int(name.split('-')[-1]) for name in list_name_to_id.keys()])
-
-        # Determine the needed indexes
-        all_indexes = set(range(1, max(existing_indexes + [(len(domains_to_block) + 999) // 1000]) + 1))
-        
-        # Process current lists and fill them with remaining domains
-        new_list_ids = []
-        for i in all_indexes:
-            list_name = f"{self.list_name} - {i:03d}"
-            if list_name in list_name_to_id:
-                list_id = list_name_to_id[list_name]
-                current_values = list_id_to_domains[list_id]
-                remove_items = current_values - set(domains_to_block)
-                chunk = current_values - remove_items
-
-                new_items = []
-                if len(chunk) < 1000:
-                    needed_items = 1000 - len(chunk)
-                    new_items = list(remaining_domains)[:needed_items]
-                    chunk.update(new_items)
-                    remaining_domains.difference_update(new_items)
-
-                if remove_items or new_items:
-                    update_list(list_id, remove_items, new_items)
-                    info(
-                        f"Updated list: {list_name} "
-                        f"| Added {len(new_items)} domains,"
-                        f"Removed {len(remove_items)} domains "
-                        f"| Total domains in list: {len(chunk)}"
-                    )
-                    self.cache["mapping"][list_id] = list(chunk)
-                else:
-                    silent_error(
-                        f"Skipped update list: {list_name} "
-                        f"| Total domains in list: {len(chunk)}"
-                    )
-                
-                new_list_ids.append(list_id)
-            else:
-                # Create new lists for remaining domains
-                if remaining_domains:
-                    needed_items = min(1000, len(remaining_domains))
-                    new_items = list(remaining_domains)[:needed_items]
-                    remaining_domains.difference_update(new_items)
-                    lst = create_list(list_name, new_items)
-                    info(f"Created list: {lst['name']} with {len(new_items)} domains")
-                    self.cache["lists"].append(lst)
-                    self.cache["mapping"][lst["id"]] = new_items
-                    new_list_ids.append(lst["id"])
-
-        # Update the rule with the new list IDs
-        cgp_rule = next((rule for rule in current_rules if rule["name"] == self.rule_name), None)
-        cgp_list_ids = utils.extract_list_ids(cgp_rule)
-
-        if cgp_rule:
-            if set(new_list_ids) != cgp_list_ids:
-                updated_rule = update_rule(self.rule_name, cgp_rule["id"], new_list_ids)
-                info(f"Updated rule {updated_rule['name']}")
-                self.cache["rules"] = [updated_rule]
-            else:
-                silent_error(f"Skipping rule update as list IDs are unchanged: {cgp_rule['name']}")
-        else:
-            rule = create_rule(self.rule_name, new_list_ids)
-            info(f"Created rule {rule['name']}")
-            self.cache["rules"].append(rule)
-        
+    def plan_resources(self, domains_to_block=None):
+        if domains_to_block is None:
+            domains_to_block = DomainConverter().process_urls()
+        if len(domains_to_block) > 300000:
+            fatal_error("The domains list exceeds Cloudflare Gateway's free limit of 300,000 domains.")
+
+        plan = build_plan(self.cache, self.list_name, self.rule_name, domains_to_block)
+        save_plan(plan)
+
+        api_calls, payload_bytes = estimate_plan(plan)
+        info(
+            f"Planned {len(plan['creates'])} list creates, "
+            f"{len(plan['patches'])} list patches, "
+            f"{len(plan['deletes'])} list deletes, "
+            f"{'1 rule ' + plan['rule']['action'] if plan['rule'] else 'no rule change'} "
+            f"| Estimated {api_calls} API calls, {payload_bytes} payload bytes"
+        )
+        return plan
+
+    def update_resources(self, domains_to_block=None):
+        plan = self.plan_resources(domains_to_block)
+        self.apply_resources(plan)
+
+    def apply_resources(self, plan=None):
+        if plan is None:
+            plan = load_plan()
+            if plan["list_name"] != self.list_name or plan["rule_name"] != self.rule_name:
+                error("The saved plan was made for a different prefix. Run 'plan' again.")
+            if plan["state"] != state_digest(self.cache):
+                error("Cloudflare state changed since the plan was made. Run 'plan' again.")
+
+        apply_plan(self.cache, self.journal, plan)
+
+        # The cache now holds every applied operation, so the journal can go
         utils.save_cache(self.cache)
+        self.journal.clear()
 
 
     def delete_resources(self):
@@ -136,18 +93,32 @@ class CloudflareManager:
 
 def main():
     parser = argparse.ArgumentParser(description="Cloudflare Manager Script")
-    parser.add_argument("action", choices=["run", "leave"], help="Choose action: run or leave")
+    parser.add_argument("action", choices=["run", "plan", "apply", "analyze", "leave", "daemon"], help="Choose action: run, plan, apply, analyze, leave or daemon")
     args = parser.parse_args()    
+
+    # Read-only report on the sources, needs no cache or Cloudflare state
+    if args.action == "analyze":
+        analyze_sources(DomainConverter())
+        return
+
     cloudflare_manager = CloudflareManager(PREFIX)
     
     if args.action == "run":
         cloudflare_manager.update_resources()
         if utils.is_running_in_github_actions():
             utils.delete_cache()
+    elif args.action == "plan":
+        cloudflare_manager.plan_resources()
+    elif args.action == "apply":
+        cloudflare_manager.apply_resources()
     elif args.action == "leave":
         cloudflare_manager.delete_resources()
+    elif args.action == "daemon":
+        Daemon(cloudflare_manager).run()
     else:
-        error("Invalid action. Please choose either 'run' or 'leave'.")
+        error("Invalid action. Please choose either 'run', 'plan', 'apply', 'analyze', 'leave' or 'daemon'.")
+
+    utils.wait_for_housekeeping()
 
 if __name__ == "__main__":
     main()
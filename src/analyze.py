@@ -0,0 +1,72 @@
+import time
+from src import info, silent_error, convert
+
+
+# Report what each ad source costs and what it adds to the final list,
+# so sources with little unique coverage can be dropped
+def analyze_sources(converter):
+    names = converter.read_source_names("ADLIST_URLS")
+    sources = []
+    for url in converter.adlist_urls:
+        try:
+            content = converter.download_file(url)
+        except Exception as e:
+            # One failing source should not abort the whole report
+            silent_error(f"Skipping {url}: {e}")
+            continue
+
+        start = time.perf_counter()
+        block_domains, allow_domains = set(), set()
+        convert.parse_rules(content, block_domains, allow_domains)
+        collapsed = convert.remove_subdomains_if_higher(block_domains)
+        parse_time = time.perf_counter() - start
+
+        sources.append({
+            "name": names.get(url, url),
+            "bytes": converter.download_stats[url]["bytes"],
+            "parse_time": parse_time,
+            "total": len(block_domains),
+            "domains": collapsed
+        })
+
+    # Bitmask of the sources listing each domain
+    owners = {}
+    for index, source in enumerate(sources):
+        for domain in source["domains"]:
+            owners[domain] = owners.get(domain, 0) | (1 << index)
+
+    for index, source in enumerate(sources):
+        bit = 1 << index
+        unique = 0
+        overlap = [0] * len(sources)
+        for domain in source["domains"]:
+            # A domain is also covered by any source that lists one of its parents
+            mask = 0
+            parts = domain.split(".")
+            for i in range(len(parts)):
+                mask |= owners.get(".".join(parts[i:]), 0)
+            mask &= ~bit
+            if not mask:
+                unique += 1
+            for other in range(len(sources)):
+                if mask & (1 << other):
+                    overlap[other] += 1
+        source["unique"] = unique
+        source["overlap"] = overlap
+
+    for source in sorted(sources, key=lambda s: s["unique"]):
+        count = len(source["domains"]) or 1
+        overlaps = ", ".join(
+            f"{other['name']} {source['overlap'][i] * 100 / count:.0f}%"
+            for i, other in enumerate(sources)
+            if source["overlap"][i]
+        )
+        info(
+            f"Source {source['name']} "
+            f"| Downloaded {source['bytes']} bytes, parsed in {source['parse_time']:.2f}s "
+            f"| Total {source['total']} domains, {len(source['domains'])} after collapse, "
+            f"{source['unique']} unique "
+            f"| Overlap: {overlaps or 'none'}"
+        )
+
+    return sources
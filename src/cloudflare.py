@@ -4,16 +4,35 @@ from src.requests import (
 )
 
 
-@retry(**retry_config)
-@rate_limited_request
-def create_list(name, domains):
-    endpoint = "/lists"
-    data = {
+# Request bodies, shared with the plan estimator
+def list_payload(name, domains):
+    return {
         "name": name,
         "description": "Ads & Tracking Domains",
         "type": "DOMAIN",
         "items": [{"value": domain} for domain in domains]
     }
+
+def update_list_payload(remove_items, append_items):
+    return {
+        "remove": [domain for domain in remove_items],
+        "append": [{"value": domain} for domain in append_items]
+    }
+
+def rule_payload(rule_name, list_ids):
+    return {
+        "name": rule_name,
+        "description": "Block Ads & Tracking",
+        "action": "block",
+        "traffic": " or ".join(f'any(dns.domains[*] in ${lst})' for lst in list_ids),
+        "enabled": True,
+    }
+
+@retry(**retry_config)
+@rate_limited_request
+def create_list(name, domains):
+    endpoint = "/lists"
+    data = list_payload(name, domains)
     status, response = cloudflare_gateway_request("POST", endpoint, body=json.dumps(data))
     return response["result"]
 
@@ -21,36 +40,21 @@ def create_list(name, domains):
 @rate_limited_request
 def update_list(list_id, remove_items, append_items):
     endpoint = f"/lists/{list_id}"    
-    data = {
-        "remove": [domain for domain in remove_items],
-        "append": [{"value": domain} for domain in append_items]
-    }    
+    data = update_list_payload(remove_items, append_items)
     status, response = cloudflare_gateway_request("PATCH", endpoint, body=json.dumps(data))
     return response["result"]
 
 @retry(**retry_config)
 def create_rule(rule_name, list_ids):
     endpoint = "/rules"
-    data = {
-        "name": rule_name,
-        "description": "Block Ads & Tracking",
-        "action": "block",
-        "traffic": " or ".join(f'any(dns.domains[*] in ${lst})' for lst in list_ids),
-        "enabled": True,
-    }
+    data = rule_payload(rule_name, list_ids)
     status, response = cloudflare_gateway_request("POST", endpoint, body=json.dumps(data))
     return response["result"]
 
 @retry(**retry_config)
 def update_rule(rule_name, rule_id, list_ids):
     endpoint = f"/rules/{rule_id}"
-    data = {
-        "name": rule_name,
-        "description": "Block Ads & Tracking",
-        "action": "block",
-        "traffic": " or ".join(f'any(dns.domains[*] in ${lst})' for lst in list_ids),
-        "enabled": True,
-    }
+    data = rule_payload(rule_name, list_ids)
     status, response = cloudflare_gateway_request("PUT", endpoint, body=json.dumps(data))
     return response["result"]
 
@@ -5,18 +5,26 @@ from src import (
     replace_pattern
 )
 
+# Modifiers that keep an exception rule meaningful at the DNS level
+DNS_EXCEPTION_MODIFIERS = {"important"}
+
 def convert_to_domain_list(block_content: str, white_content: str) -> list[str]:
     white_domains = set()
     block_domains = set()
 
     extract_domains(white_content, white_domains)
-    info(f"Number of whitelisted domains: {len(white_domains)}")
 
-    extract_domains(block_content, block_domains)
+    # Exception rules in block sources end up in the whitelist
+    parse_rules(block_content, block_domains, white_domains)
+    info(f"Number of whitelist entries (whitelists and exception rules): {len(white_domains)}")
+
+    return finalize_domains(block_domains, white_domains)
+
+def finalize_domains(block_domains: set[str], white_domains: set[str]) -> list[str]:
     block_domains = remove_subdomains_if_higher(block_domains)
     info(f"Number of blocked domains: {len(block_domains)}")
 
-    final_domains = sorted(list(block_domains - white_domains))
+    final_domains = sorted(WhitelistIndex(white_domains).filter(block_domains))
     info(f"Number of final domains: {len(final_domains)}")
 
     return final_domains
@@ -27,13 +35,131 @@ def extract_domains(content: str, domains: set[str]) -> None:
             continue
 
         cleaned_line = line.lower().strip().split("#")[0].split("^")[0].replace("\r", "")
-        domain = replace_pattern.sub("", cleaned_line, count=1)
-        try:
-            domain = domain.encode("idna").decode("utf-8", "replace")
-            if domain_pattern.match(domain) and not ip_pattern.match(domain):
-                domains.add(domain)
-        except Exception:
-            pass
+        domain = normalize_domain(cleaned_line)
+        if domain:
+            domains.add(whitelist_entry(cleaned_line, domain))
+
+def whitelist_entry(rule: str, domain: str) -> str:
+    # Keep the match type so the whitelist index can exempt subdomains:
+    # "||example.com" also matches subdomains, "*.example.com" only subdomains
+    rule = rule.removeprefix("@@")
+    if rule.startswith("||"):
+        return f"||{domain}"
+    if rule.startswith("*."):
+        return f"*.{domain}"
+    return domain
+
+def normalize_domain(text: str) -> str | None:
+    domain = replace_pattern.sub("", text, count=1)
+    try:
+        domain = domain.encode("idna").decode("utf-8", "replace")
+        if domain_pattern.match(domain) and not ip_pattern.match(domain):
+            return domain
+    except Exception:
+        pass
+    return None
+
+def parse_rules(content: str, block_domains: set[str], allow_domains: set[str]) -> None:
+    # Split every line into block and allow rules in a single pass.
+    # $badfilter may disable a rule that appears later in the content,
+    # so rules are keyed by their text and resolved once at the end.
+    rules = {}
+    badfilters = set()
+    collect_rules(content, rules, badfilters)
+    resolve_rules(rules, badfilters, block_domains, allow_domains)
+
+def collect_rules(content: str, rules: dict, badfilters: set) -> None:
+    for line in content.splitlines():
+        if line.startswith(("#", "!", "/")) or line == "":
+            continue
+
+        cleaned_line = line.lower().strip().split("#")[0].replace("\r", "")
+        rule, _, modifiers = cleaned_line.partition("$")
+        raw_options = {option.strip() for option in modifiers.split(",") if option.strip()}
+        options = dict(option.partition("=")[::2] for option in raw_options)
+
+        key = (rule, frozenset(raw_options - {"badfilter"}))
+        if "badfilter" in options:
+            badfilters.add(key)
+            continue
+
+        domain = normalize_domain(rule.split("^")[0])
+        if domain:
+            rules[key] = (domain, rule.startswith("@@"), options)
+
+def resolve_rules(rules: dict, badfilters: set, block_domains: set[str], allow_domains: set[str]) -> None:
+    # Rules collected from several sources can be resolved together, so
+    # $badfilter and $important apply across all of them
+    block, allow = set(), set()
+    important_block, important_allow = set(), set()
+    for key, (domain, is_exception, options) in rules.items():
+        if key in badfilters:
+            continue
+
+        if is_exception:
+            # Browser exceptions ($domain=, content types, cosmetic ones) are
+            # scoped to pages or resources and say nothing about DNS
+            if set(options) - DNS_EXCEPTION_MODIFIERS:
+                continue
+            allow.add(whitelist_entry(key[0], domain))
+            if "important" in options:
+                important_allow.add(domain)
+        else:
+            block.add(domain)
+            if "important" in options:
+                important_block.add(domain)
+            # $denyallow only narrows this rule, so just its own subdomains
+            # are exempted and nothing else blocked by other rules
+            for value in options.get("denyallow", "").split("|"):
+                excluded = normalize_domain(value.strip())
+                if excluded and excluded.endswith(f".{domain}"):
+                    allow.add(excluded)
+
+    # $important block rules win over exceptions unless those are $important too
+    overridden = important_block - important_allow
+    allow = {entry for entry in allow if entry.removeprefix("||").removeprefix("*.") not in overridden}
+
+    block_domains.update(block)
+    allow_domains.update(allow)
+            
+class WhitelistIndex:
+    # Exact entries live in a set, suffix and wildcard entries in a trie
+    # keyed by reversed labels, so each lookup walks a domain's labels once
+    SUFFIX = "||"
+    WILDCARD = "*"
+
+    def __init__(self, entries: set[str]):
+        self.exact = set()
+        self.trie = {}
+        for entry in entries:
+            if entry.startswith("||"):
+                self.add(entry[2:], self.SUFFIX)
+            elif entry.startswith("*."):
+                self.add(entry[2:], self.WILDCARD)
+            else:
+                self.exact.add(entry)
+
+    def add(self, domain: str, marker: str) -> None:
+        node = self.trie
+        for label in reversed(domain.split(".")):
+            node = node.setdefault(label, {})
+        node[marker] = True
+
+    def matches(self, domain: str) -> bool:
+        if domain in self.exact:
+            return True
+        node = self.trie
+        labels = domain.split(".")
+        for remaining in range(len(labels) - 1, -1, -1):
+            node = node.get(labels[remaining])
+            if node is None:
+                return False
+            if self.SUFFIX in node or (self.WILDCARD in node and remaining > 0):
+                return True
+        return False
+
+    def filter(self, domains: set[str]) -> list[str]:
+        return [domain for domain in domains if not self.matches(domain)]
             
 def remove_subdomains_if_higher(domains: set[str]) -> set[str]:
     top_level_domains = set()
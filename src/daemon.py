@@ -0,0 +1,205 @@
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from src import (
+    utils, info, silent_error, convert, max_age_pattern,
+    DAEMON_INTERVAL, DAEMON_MIN_INTERVAL, DAEMON_PORT
+)
+from src import requests
+from src.domains import DomainConverter
+from src.journal import resume
+
+
+# Long-running mode: keep parsed sources and Cloudflare state in memory
+# and push only the domain deltas when a source changes
+class Daemon:
+    def __init__(self, manager, interval=DAEMON_INTERVAL, port=DAEMON_PORT):
+        self.manager = manager
+        self.converter = DomainConverter()
+        self.interval = interval
+        self.port = port
+        self.domains = None
+        # Set when a sync fails so the next tick retries it
+        self.dirty = False
+        self.lock = threading.Lock()
+
+        # Parsed rules or whitelist entries and next poll time per source.
+        # Block rules are kept unresolved so that $badfilter and $important
+        # apply across sources, exactly like the one-shot run. "parsed" stays
+        # None until the source has been downloaded once.
+        self.sources = {}
+        for url in self.converter.adlist_urls:
+            self.sources[url] = {"whitelist": False, "next_poll": 0, "parsed": None}
+        for url in self.converter.whitelist_urls:
+            self.sources[url] = {"whitelist": True, "next_poll": 0, "parsed": None}
+        self.dynamic = {"block": ({}, set()), "allow": set()}
+
+        self.metrics = {
+            "started": time.time(),
+            "polls": 0,
+            "not_modified": 0,
+            "changed": 0,
+            "errors": 0,
+            "syncs": 0,
+            "last_sync": None,
+            "domains": 0
+        }
+
+    def poll_interval(self, url):
+        # Follow the server's Cache-Control max-age, bounded by our own limits
+        cache_control = self.converter.validators.get(url, {}).get("Cache-Control") or ""
+        match = max_age_pattern.search(cache_control)
+        if not match:
+            return self.interval
+        return min(max(int(match.group(1)), DAEMON_MIN_INTERVAL), self.interval)
+
+    def parse_source(self, content, whitelist):
+        if whitelist:
+            allow_domains = set()
+            convert.extract_domains(content, allow_domains)
+            return allow_domains
+        rules, badfilters = {}, set()
+        convert.collect_rules(content, rules, badfilters)
+        return rules, badfilters
+
+    def poll_sources(self):
+        changed = False
+        now = time.time()
+
+        for url, source in self.sources.items():
+            if source["next_poll"] > now:
+                continue
+
+            self.metrics["polls"] += 1
+            try:
+                content = self.converter.download_file(url, conditional=True)
+            except Exception as e:
+                # One failing source must not stop the daemon
+                silent_error(f"Failed to poll {url}: {e}")
+                self.metrics["errors"] += 1
+                source["next_poll"] = now + DAEMON_MIN_INTERVAL
+                continue
+
+            source["next_poll"] = now + self.poll_interval(url)
+            if content is None:
+                self.metrics["not_modified"] += 1
+                continue
+
+            parsed = self.parse_source(content, source["whitelist"])
+            if parsed != source["parsed"]:
+                source["parsed"] = parsed
+                self.metrics["changed"] += 1
+                changed = True
+
+        # Dynamic lists are local, so they are re-read on every tick
+        dynamic = {
+            "block": self.parse_source(self.converter.read_dynamic_list("DYNAMIC_BLACKLIST"), False),
+            "allow": self.parse_source(self.converter.read_dynamic_list("DYNAMIC_WHITELIST"), True)
+        }
+        if dynamic != self.dynamic:
+            self.dynamic = dynamic
+            changed = True
+
+        return changed
+
+    def ready(self):
+        # Syncing with a source missing would delete its domains from Cloudflare
+        return all(source["parsed"] is not None for source in self.sources.values())
+
+    def sync(self):
+        # Resolve the rules of every block source in one go
+        rules, badfilters = dict(self.dynamic["block"][0]), set(self.dynamic["block"][1])
+        allow_domains = set(self.dynamic["allow"])
+        for source in self.sources.values():
+            if source["whitelist"]:
+                allow_domains.update(source["parsed"])
+            else:
+                rules.update(source["parsed"][0])
+                badfilters.update(source["parsed"][1])
+
+        block_domains = set()
+        convert.resolve_rules(rules, badfilters, block_domains, allow_domains)
+        domains = convert.finalize_domains(block_domains, allow_domains)
+        if domains == self.domains:
+            silent_error("Skipping sync as the domain list is unchanged")
+            self.dirty = False
+            return
+
+        # The manager keeps its cache in memory, so only the changed lists are patched
+        self.manager.update_resources(domains)
+        self.dirty = False
+        with self.lock:
+            self.domains = domains
+            self.metrics["syncs"] += 1
+            self.metrics["last_sync"] = time.time()
+            self.metrics["domains"] = len(domains)
+
+    def recover(self):
+        # A failed apply leaves the in-memory cache behind the journal,
+        # so bring it up to date before the next tick plans again
+        try:
+            if resume(self.manager.cache, self.manager.journal):
+                utils.save_cache(self.manager.cache)
+                self.manager.journal.clear()
+        except Exception as e:
+            silent_error(f"Failed to resume from journal: {e}")
+            # Fall back to a cold cache that is rebuilt from Cloudflare
+            self.manager.cache = {"lists": [], "rules": [], "mapping": {}}
+            self.manager.journal.clear()
+
+    def status(self):
+        with self.lock:
+            return dict(self.metrics, uptime=time.time() - self.metrics["started"])
+
+    def serve(self):
+        daemon = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/health":
+                    body = {"status": "ok" if daemon.domains is not None else "starting"}
+                elif self.path == "/metrics":
+                    body = daemon.status()
+                else:
+                    self.send_error(404)
+                    return
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", self.port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        info(f"Serving health and metrics on http://127.0.0.1:{self.port}")
+        return server
+
+    def run(self):
+        requests.exit_on_error = False
+        server = self.serve()
+        try:
+            while True:
+                try:
+                    changed = self.poll_sources()
+                    if not self.ready():
+                        silent_error("Waiting for every source to download before syncing")
+                    elif changed or self.dirty or self.domains is None:
+                        self.sync()
+                except Exception as e:
+                    # Keep the previous domain list and retry the sync on the next tick
+                    silent_error(f"Sync failed: {e}")
+                    self.metrics["errors"] += 1
+                    self.dirty = True
+                    self.recover()
+
+                next_poll = min((s["next_poll"] for s in self.sources.values()), default=time.time() + 60)
+                time.sleep(min(max(next_poll - time.time(), 1), 60))
+        except KeyboardInterrupt:
+            info("Stopping daemon")
+        finally:
+            server.shutdown()
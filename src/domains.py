@@ -1,9 +1,18 @@
 import os
+import ssl
+import time
+import socket
+import codecs
 import http.client
 from urllib.parse import urlparse, urljoin
 from configparser import ConfigParser
 from src import info, convert, silent_error, error
-from src.requests import retry, retry_config, RateLimitException, HTTPException
+from src.requests import (
+    retry, retry_config, RateLimitException, HTTPException,
+    StreamDecompressor, ACCEPT_ENCODING
+)
+
+CHUNK_SIZE = 64 * 1024
 
 # Define the DomainConverter class for processing URL lists
 class DomainConverter:
@@ -18,6 +27,9 @@ class DomainConverter:
         # Read adlist and whitelist URLs from environment and files
         self.adlist_urls = self.read_urls("ADLIST_URLS")
         self.whitelist_urls = self.read_urls("WHITELIST_URLS")
+        # Response validators and transfer stats per URL
+        self.validators = {}
+        self.download_stats = {}
 
     def read_urls_from_file(self, filename):
         urls = []
@@ -37,6 +49,17 @@ class DomainConverter:
                 ]
         return urls
     
+    def read_source_names(self, env_var):
+        # Map each URL in the INI file to the name it is listed under
+        config = ConfigParser()
+        config.optionxform = str
+        config.read(self.env_file_map[env_var])
+        return {
+            config.get(section, key): key
+            for section in config.sections()
+            for key in config.options(section)
+        }
+
     def read_urls_from_env(self, env_var):
         urls = os.getenv(env_var, "")
         return [url.strip() for url in urls.split() if url.strip()]
@@ -47,8 +70,30 @@ class DomainConverter:
         urls += self.read_urls_from_env(env_var)
         return urls
 
+    def read_dynamic_list(self, env_var):
+        content = os.getenv(env_var, "")
+        if content:
+            return content
+        with open(self.env_file_map[env_var], "r") as file:
+            return file.read()
+
     @retry(**retry_config)
-    def download_file(self, url):
+    def download_file(self, url, conditional=False):
+        try:
+            return self.fetch_file(url, conditional)
+        except (http.client.HTTPException, ssl.SSLError, socket.timeout, OSError) as e:
+            # Surface network failures as HTTPException so they are retried
+            error_message = f"Network error while downloading {url}: {e}"
+            silent_error(error_message)
+            raise HTTPException(error_message)
+        except UnicodeDecodeError as e:
+            error_message = f"Failed to decode file from {url}: {e}"
+            silent_error(error_message)
+            raise HTTPException(error_message)
+
+    def fetch_file(self, url, conditional=False):
+        source_url = url
+        start = time.perf_counter()
         parsed_url = urlparse(url)
         if parsed_url.scheme == "https":
             conn = http.client.HTTPSConnection(parsed_url.netloc)
@@ -56,8 +101,16 @@ class DomainConverter:
             conn = http.client.HTTPConnection(parsed_url.netloc)
     
         headers = {
-            'User-Agent': 'Mozilla/5.0'
+            'User-Agent': 'Mozilla/5.0',
+            'Accept-Encoding': ACCEPT_ENCODING
         }
+
+        # Ask the server to skip the body if the file is unchanged
+        validators = self.validators.get(source_url, {}) if conditional else {}
+        if validators.get('ETag'):
+            headers['If-None-Match'] = validators['ETag']
+        if validators.get('Last-Modified'):
+            headers['If-Modified-Since'] = validators['Last-Modified']
     
         conn.request("GET", parsed_url.path, headers=headers)
         response = conn.getresponse()
@@ -83,6 +136,11 @@ class DomainConverter:
             conn.request("GET", parsed_url.path, headers=headers)
             response = conn.getresponse()
     
+        if response.status == 304:
+            conn.close()
+            info(f"File from {source_url} not modified")
+            return None
+
         # Raise error for non-200 status codes
         if response.status != 200:
             error_message = f"Failed to download file from {url}, status code: {response.status}"
@@ -93,10 +151,35 @@ class DomainConverter:
             else:
                 raise HTTPException(error_message)
 
-        # Read response data and close the connection
-        data = response.read().decode('utf-8')
+        self.validators[source_url] = {
+            header: response.getheader(header)
+            for header in ('ETag', 'Last-Modified', 'Cache-Control')
+        }
+
+        # Decompress and decode while reading, then close the connection
+        decompressor = StreamDecompressor(response.getheader('Content-Encoding'))
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        chunks = []
+        received = size = 0
+        while chunk := response.read(CHUNK_SIZE):
+            received += len(chunk)
+            raw = decompressor.decompress(chunk)
+            size += len(raw)
+            chunks.append(decoder.decode(raw))
+        raw = decompressor.flush()
+        size += len(raw)
+        chunks.append(decoder.decode(raw, final=True))
         conn.close()
-        info(f"Downloaded file from {url}. File size: {len(data)}")
+
+        data = "".join(chunks)
+        elapsed = time.perf_counter() - start
+        ratio = size / received if received else 1
+        self.download_stats[source_url] = {"bytes": received, "size": size, "seconds": elapsed}
+        info(
+            f"Downloaded file from {url}. File size: {len(data)} "
+            f"| Transferred {received} bytes ({decompressor.encoding}, ratio {ratio:.2f}x) "
+            f"in {elapsed:.2f}s"
+        )
         return data
 
     def process_urls(self):
@@ -108,20 +191,8 @@ class DomainConverter:
             white_content += self.download_file(url)
         
         # Read additional dynamic lists
-        dynamic_blacklist = os.getenv("DYNAMIC_BLACKLIST", "")
-        dynamic_whitelist = os.getenv("DYNAMIC_WHITELIST", "")
-        
-        if dynamic_blacklist:
-            block_content += dynamic_blacklist
-        else:
-            with open(self.env_file_map["DYNAMIC_BLACKLIST"], "r") as black_file:
-                block_content += black_file.read()
-        
-        if dynamic_whitelist:
-            white_content += dynamic_whitelist
-        else:
-            with open(self.env_file_map["DYNAMIC_WHITELIST"], "r") as white_file:
-                white_content += white_file.read()
+        block_content += self.read_dynamic_list("DYNAMIC_BLACKLIST")
+        white_content += self.read_dynamic_list("DYNAMIC_WHITELIST")
         
         # Convert the collected content into a domain list
         domains = convert.convert_to_domain_list(block_content, white_content)
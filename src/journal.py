@@ -0,0 +1,106 @@
+import os
+import json
+import uuid
+import threading
+from src import info, silent_error, JOURNAL_FILE
+from src.cloudflare import get_lists
+
+
+# Append-only log of Cloudflare operations. Every entry is fsync'd so an
+# interrupted sync can be replayed on top of the last saved cache.
+class Journal:
+    def __init__(self, path=JOURNAL_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def record(self, entry):
+        line = json.dumps(entry) + "\n"
+        with self.lock, open(self.path, "a") as file:
+            file.write(line)
+            file.flush()
+            os.fsync(file.fileno())
+
+    def plan(self, op, **args):
+        entry_id = uuid.uuid4().hex
+        self.record({"id": entry_id, "state": "planned", "op": op, **args})
+        return entry_id
+
+    def applied(self, entry_id, **result):
+        self.record({"id": entry_id, "state": "applied", **result})
+
+    def entries(self):
+        if not os.path.exists(self.path):
+            return []
+        entries = []
+        with open(self.path, "r") as file:
+            for line in file:
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # A torn write at the tail, the operation never got acknowledged
+                    break
+        return entries
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def replay(cache, entry, result):
+    op = entry["op"]
+    if op == "create_list":
+        lst = result["list"]
+        if all(item["id"] != lst["id"] for item in cache["lists"]):
+            cache["lists"].append(lst)
+        cache["mapping"][lst["id"]] = entry["items"]
+    elif op == "update_list":
+        if entry["list_id"] in cache["mapping"]:
+            items = set(cache["mapping"][entry["list_id"]]) - set(entry["remove"])
+            cache["mapping"][entry["list_id"]] = list(items | set(entry["append"]))
+    elif op in ("create_rule", "update_rule"):
+        cache["rules"] = [result["rule"]]
+    elif op == "delete_list":
+        cache["lists"] = [item for item in cache["lists"] if item["id"] != entry["list_id"]]
+        cache["mapping"].pop(entry["list_id"], None)
+
+
+def verify(cache, entry):
+    # Unknown outcome, so check Cloudflare or drop the cached state it touched
+    op = entry["op"]
+    if op == "create_list":
+        lst = next((l for l in get_lists(entry["name"]) if l["name"] == entry["name"]), None)
+        if lst and all(item["id"] != lst["id"] for item in cache["lists"]):
+            cache["lists"].append(lst)
+            cache["mapping"].pop(lst["id"], None)
+    elif op == "update_list":
+        cache["mapping"].pop(entry["list_id"], None)
+    elif op in ("create_rule", "update_rule"):
+        cache["rules"] = []
+    elif op == "delete_list":
+        if all(l["id"] != entry["list_id"] for l in get_lists(entry["name"])):
+            cache["lists"] = [item for item in cache["lists"] if item["id"] != entry["list_id"]]
+            cache["mapping"].pop(entry["list_id"], None)
+
+
+def resume(cache, journal):
+    entries = journal.entries()
+    if not entries:
+        return False
+
+    if not cache["lists"]:
+        # A cold cache is rebuilt from Cloudflare anyway
+        silent_error("Discarding journal as there is no cache to resume")
+        journal.clear()
+        return False
+
+    planned = {e["id"]: e for e in entries if e["state"] == "planned"}
+    applied = {e["id"]: e for e in entries if e["state"] == "applied"}
+    for entry_id, entry in planned.items():
+        if entry_id in applied:
+            replay(cache, entry, applied[entry_id])
+        else:
+            verify(cache, entry)
+            info(f"Verified unfinished operation: {entry['op']}")
+
+    info(f"Resumed {len(applied)} applied and {len(planned) - len(applied)} unfinished operations from journal")
+    return True
@@ -0,0 +1,219 @@
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from src import utils, info, silent_error, PLAN_FILE, APPLY_WORKERS, APPLY_BATCH_SIZE
+from src.cloudflare import (
+    create_list, update_list, create_rule, update_rule, delete_list,
+    list_payload, update_list_payload, rule_payload
+)
+
+# Placeholder for list IDs that only exist once the plan is applied
+PLACEHOLDER_ID = "00000000-0000-0000-0000-000000000000"
+
+
+def build_plan(cache, list_name, rule_name, domains_to_block):
+    current_lists = utils.get_current_lists(cache, list_name)
+    current_rules = utils.get_current_rules(cache, rule_name)
+
+    # Mapping list_id to current domains in that list
+    list_id_to_domains = {}
+    for lst in current_lists:
+        items = utils.get_list_items_cached(cache, lst["id"])
+        list_id_to_domains[lst["id"]] = set(items)
+
+    # Domains that are wanted but not in any list yet, handed out in order
+    wanted = set(domains_to_block)
+    listed = set().union(*list_id_to_domains.values())
+    remaining_domains = sorted(wanted - listed)
+    position = 0
+
+    # Create a dictionary for list names to keep track of missing indexes
+    list_name_to_id = {lst["name"]: lst["id"] for lst in current_lists}
+    existing_indexes = sorted([int(name.split('-')[-1]) for name in list_name_to_id.keys()])
+
+    # Determine the needed indexes
+    all_indexes = range(1, max(existing_indexes + [(len(domains_to_block) + 999) // 1000]) + 1)
+
+    plan = {
+        "list_name": list_name,
+        "rule_name": rule_name,
+        "existing": list_name_to_id,
+        "creates": [],
+        "patches": [],
+        "deletes": [],
+        "skipped": [],
+        "lists": [],
+        "rule": None
+    }
+
+    for i in all_indexes:
+        name = f"{list_name} - {i:03d}"
+        if name in list_name_to_id:
+            list_id = list_name_to_id[name]
+            current_values = list_id_to_domains[list_id]
+            remove_items = current_values - wanted
+            total = len(current_values) - len(remove_items)
+
+            new_items = []
+            if total < 1000:
+                new_items = remaining_domains[position:position + 1000 - total]
+                position += len(new_items)
+                total += len(new_items)
+
+            if not total:
+                # Nothing left for this list, drop it once the rule stops using it
+                plan["deletes"].append({"list_id": list_id, "name": name})
+                continue
+
+            if remove_items or new_items:
+                plan["patches"].append({
+                    "list_id": list_id,
+                    "name": name,
+                    "remove": sorted(remove_items),
+                    "append": new_items,
+                    "total": total
+                })
+            else:
+                plan["skipped"].append({"name": name, "total": total})
+            plan["lists"].append(name)
+        elif position < len(remaining_domains):
+            # Create new lists for remaining domains
+            new_items = remaining_domains[position:position + 1000]
+            position += len(new_items)
+            plan["creates"].append({"name": name, "items": new_items})
+            plan["lists"].append(name)
+
+    # Update the rule only when its list IDs change
+    cgp_rule = next((rule for rule in current_rules if rule["name"] == rule_name), None)
+    cgp_list_ids = utils.extract_list_ids(cgp_rule)
+    kept_list_ids = {list_name_to_id[name] for name in plan["lists"] if name in list_name_to_id}
+
+    if not cgp_rule:
+        plan["rule"] = {"action": "create"}
+    elif plan["creates"] or kept_list_ids != cgp_list_ids:
+        plan["rule"] = {"action": "update", "rule_id": cgp_rule["id"]}
+    else:
+        silent_error(f"Skipping rule update as list IDs are unchanged: {cgp_rule['name']}")
+
+    # Lets a saved plan detect that the state it was built from has moved on
+    plan["state"] = state_digest(cache)
+    return plan
+
+
+def state_digest(cache):
+    state = {
+        "lists": sorted((lst["id"], lst["name"]) for lst in cache["lists"]),
+        "rules": sorted((rule["id"], rule.get("traffic") or "") for rule in cache["rules"]),
+        "mapping": {list_id: sorted(items) for list_id, items in cache["mapping"].items()}
+    }
+    return hashlib.sha256(json.dumps(state, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def estimate_plan(plan):
+    payloads = [list_payload(c["name"], c["items"]) for c in plan["creates"]]
+    payloads += [update_list_payload(p["remove"], p["append"]) for p in plan["patches"]]
+    if plan["rule"]:
+        payloads.append(rule_payload(plan["rule_name"], [PLACEHOLDER_ID] * len(plan["lists"])))
+
+    api_calls = len(payloads) + len(plan["deletes"])
+    payload_bytes = sum(len(json.dumps(payload)) for payload in payloads)
+    return api_calls, payload_bytes
+
+
+def save_plan(plan, path=PLAN_FILE):
+    with open(path, 'w') as file:
+        json.dump(plan, file)
+
+
+def load_plan(path=PLAN_FILE):
+    with open(path, 'r') as file:
+        return json.load(file)
+
+
+def apply_patch(journal, patch):
+    entry_id = journal.plan(
+        "update_list", list_id=patch["list_id"],
+        remove=patch["remove"], append=patch["append"]
+    )
+    update_list(patch["list_id"], patch["remove"], patch["append"])
+    journal.applied(entry_id)
+
+
+def apply_create(journal, create):
+    entry_id = journal.plan("create_list", name=create["name"], items=create["items"])
+    lst = create_list(create["name"], create["items"])
+    journal.applied(entry_id, list=lst)
+    return lst
+
+
+def apply_plan(cache, journal, plan):
+    list_ids = dict(plan["existing"])
+    ops = plan["patches"] + plan["creates"]
+
+    # Cloudflare has no multi-list endpoint, so each list gets one request with
+    # all of its changes. Lists are independent, so every batch runs concurrently
+    # and the cache is checkpointed to disk once the batch is done.
+    for start in range(0, len(ops), APPLY_BATCH_SIZE):
+        batch = ops[start:start + APPLY_BATCH_SIZE]
+        with ThreadPoolExecutor(max_workers=APPLY_WORKERS) as executor:
+            futures = {
+                executor.submit(apply_patch if "list_id" in op else apply_create, journal, op): op
+                for op in batch
+            }
+
+        # Record every request that went through before surfacing a failure
+        failure = None
+        for future, op in futures.items():
+            if future.exception():
+                failure = failure or future.exception()
+                continue
+            if "list_id" in op:
+                items = set(cache["mapping"].get(op["list_id"], [])) - set(op["remove"])
+                cache["mapping"][op["list_id"]] = list(items | set(op["append"]))
+                info(
+                    f"Updated list: {op['name']} "
+                    f"| Added {len(op['append'])} domains,"
+                    f"Removed {len(op['remove'])} domains "
+                    f"| Total domains in list: {op['total']}"
+                )
+            else:
+                result = future.result()
+                info(f"Created list: {result['name']} with {len(op['items'])} domains")
+                cache["lists"].append(result)
+                cache["mapping"][result["id"]] = op["items"]
+                list_ids[op["name"]] = result["id"]
+
+        utils.save_cache(cache)
+        if failure:
+            raise failure
+
+    for skipped in plan["skipped"]:
+        silent_error(
+            f"Skipped update list: {skipped['name']} "
+            f"| Total domains in list: {skipped['total']}"
+        )
+
+    # Update the rule with the new list IDs
+    new_list_ids = [list_ids[name] for name in plan["lists"]]
+    rule_plan = plan["rule"]
+    if rule_plan and rule_plan["action"] == "update":
+        entry_id = journal.plan("update_rule", rule_id=rule_plan["rule_id"], list_ids=new_list_ids)
+        updated_rule = update_rule(plan["rule_name"], rule_plan["rule_id"], new_list_ids)
+        journal.applied(entry_id, rule=updated_rule)
+        info(f"Updated rule {updated_rule['name']}")
+        cache["rules"] = [updated_rule]
+    elif rule_plan and rule_plan["action"] == "create":
+        entry_id = journal.plan("create_rule", list_ids=new_list_ids)
+        rule = create_rule(plan["rule_name"], new_list_ids)
+        journal.applied(entry_id, rule=rule)
+        info(f"Created rule {rule['name']}")
+        cache["rules"].append(rule)
+
+    # Empty lists can only be deleted after the rule no longer references them
+    for delete in plan["deletes"]:
+        entry_id = journal.plan("delete_list", list_id=delete["list_id"], name=delete["name"])
+        delete_list(delete["list_id"])
+        journal.applied(entry_id)
+        info(f"Deleted list: {delete['name']}")
+        cache["lists"] = [item for item in cache["lists"] if item["id"] != delete["list_id"]]
+        cache["mapping"].pop(delete["list_id"], None)
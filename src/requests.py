@@ -1,16 +1,26 @@
 import ssl
-import gzip
 import json
 import time
 import random
 import http.client
 import socket
 import zlib
-from io import BytesIO
 from functools import wraps
 from typing import Optional, Tuple
 from src import info, silent_error, error, CF_IDENTIFIER, CF_API_TOKEN
 
+# Brotli is optional, only advertise it when a decoder is installed
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+ACCEPT_ENCODING = "gzip, deflate, br" if brotli else "gzip, deflate"
+BROTLI_ERROR = getattr(brotli, "error", zlib.error) if brotli else zlib.error
+
 # Custom Exceptions
 class HTTPException(Exception):
     pass
@@ -18,6 +28,65 @@ class HTTPException(Exception):
 class RateLimitException(HTTPException):
     pass
 
+# The daemon must keep running, so it turns fatal errors into HTTPException
+exit_on_error = True
+
+def fatal_error(message):
+    if exit_on_error:
+        error(message)
+    silent_error(message)
+    raise HTTPException(message)
+
+# Incremental decoder for a Content-Encoding, fed chunk by chunk
+class StreamDecompressor:
+    def __init__(self, content_encoding: Optional[str]):
+        self.encoding = (content_encoding or "identity").lower()
+        if self.encoding == "gzip":
+            self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif self.encoding == "deflate":
+            self.decompressor = zlib.decompressobj()
+        elif self.encoding == "br" and brotli:
+            self.decompressor = brotli.Decompressor()
+        elif self.encoding == "identity":
+            self.decompressor = None
+        else:
+            raise HTTPException(f"Unsupported content encoding: {content_encoding}")
+        self.started = False
+
+    def decompress(self, chunk: bytes) -> bytes:
+        if self.decompressor is None:
+            return chunk
+        try:
+            if self.encoding == "br":
+                return self.decompressor.process(chunk)
+            try:
+                data = self.decompressor.decompress(chunk)
+            except zlib.error:
+                # Some servers send raw deflate without the zlib header
+                if self.encoding != "deflate" or self.started:
+                    raise
+                self.decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+                data = self.decompressor.decompress(chunk)
+        except (zlib.error, BROTLI_ERROR) as e:
+            raise HTTPException(f"Failed to decompress {self.encoding} stream: {e}")
+        self.started = True
+        return data
+
+    def flush(self) -> bytes:
+        if self.decompressor is None:
+            return b""
+        try:
+            if self.encoding == "br":
+                data, finished = b"", self.decompressor.is_finished()
+            else:
+                data, finished = self.decompressor.flush(), self.decompressor.eof
+        except (zlib.error, BROTLI_ERROR) as e:
+            raise HTTPException(f"Failed to decompress {self.encoding} stream: {e}")
+        # A cut-off body must not pass for a complete file
+        if not finished:
+            raise HTTPException(f"Truncated {self.encoding} stream")
+        return data
+
 # Cloudflare Gateway Request Function
 def cloudflare_gateway_request(
     method: str, endpoint: str,
@@ -30,7 +99,7 @@ def cloudflare_gateway_request(
     headers = {
         "Authorization": f"Bearer {CF_API_TOKEN}",
         "Content-Type": "application/json",
-        "Accept-Encoding": "gzip, deflate"
+        "Accept-Encoding": ACCEPT_ENCODING
     }
 
     url = f"/client/v4/accounts/{CF_IDENTIFIER}/gateway{endpoint}"
@@ -43,15 +112,8 @@ def cloudflare_gateway_request(
         status = response.status
 
         # Handle different content encoding types
-        content_encoding = response.getheader('Content-Encoding')
-        if data is None or content_encoding in [None, 'identity']:
-            pass
-        elif content_encoding == 'gzip':
-            buf = BytesIO(data)
-            with gzip.GzipFile(fileobj=buf) as f:
-                data = f.read()
-        elif content_encoding == 'deflate':
-            data = zlib.decompress(data)
+        decompressor = StreamDecompressor(response.getheader('Content-Encoding'))
+        data = decompressor.decompress(data) + decompressor.flush()
 
         # Handle HTTP error status codes
         if status >= 400:
@@ -64,14 +126,14 @@ def cloudflare_gateway_request(
                 silent_error(error_message)
                 raise RateLimitException(error_message)
             elif status in [400, 403, 404]:
-                error(error_message)
+                fatal_error(error_message)
             else:
                 silent_error(error_message)
             raise HTTPException(error_message)
 
         return status, json.loads(data.decode('utf-8'))
 
-    except (http.client.HTTPException, ssl.SSLError, socket.timeout, OSError) as e:
+    except (http.client.HTTPException, ssl.SSLError, socket.timeout, OSError, zlib.error) as e:
         # Log and raise a generic HTTP exception for network-related errors
         error_message = f"Network error occurred: {e}"
         silent_error(error_message)
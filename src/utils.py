@@ -1,8 +1,13 @@
 import os
+import re
 import json
+import queue
+import threading
 import http.client
-from src import ids_pattern, CACHE_FILE
+from concurrent.futures import ThreadPoolExecutor
+from src import ids_pattern, silent_error, CACHE_FILE, JOURNAL_FILE
 from src.cloudflare import get_lists, get_rules, get_list_items
+from src.requests import HTTPException
 
 
 class GithubAPI:
@@ -13,14 +18,33 @@ class GithubAPI:
         "Accept": "application/vnd.github.v3+json",
         "User-Agent": "Mozilla/5.0"
     }
+    PER_PAGE = 100
+    TIMEOUT = 10
+    # Idle keep-alive connections shared by the worker threads
+    pool = queue.LifoQueue()
 
     @staticmethod
     def request(method, url, body=None):
-        conn = http.client.HTTPSConnection(GithubAPI.BASE_URL)
-        conn.request(method, url, body, headers=GithubAPI.HEADERS)
-        response = conn.getresponse()
+        try:
+            conn = GithubAPI.pool.get_nowait()
+        except queue.Empty:
+            conn = http.client.HTTPSConnection(GithubAPI.BASE_URL, timeout=GithubAPI.TIMEOUT)
+        try:
+            conn.request(method, url, body, headers=GithubAPI.HEADERS)
+            response = conn.getresponse()
+        except (http.client.HTTPException, OSError):
+            # The pooled connection was dropped by the server, retry on a fresh one
+            conn.close()
+            conn = http.client.HTTPSConnection(GithubAPI.BASE_URL, timeout=GithubAPI.TIMEOUT)
+            conn.request(method, url, body, headers=GithubAPI.HEADERS)
+            response = conn.getresponse()
         data = response.read()
-        conn.close()
+        GithubAPI.pool.put(conn)
+        if response.status >= 400:
+            raise HTTPException(
+                f"GitHub request failed: {response.status} {response.reason}, "
+                f"Body: {data.decode('utf-8', errors='ignore')} for URL: {url}"
+            )
         return json.loads(data) if data else {}
 
     @staticmethod
@@ -31,15 +55,59 @@ class GithubAPI:
     def get(url):
         return GithubAPI.request("GET", url)
 
+    @staticmethod
+    def get_all(url, key):
+        items = []
+        page = 1
+        separator = "&" if "?" in url else "?"
+        while True:
+            data = GithubAPI.get(f"{url}{separator}per_page={GithubAPI.PER_PAGE}&page={page}")
+            page_items = data.get(key, [])
+            items.extend(page_items)
+            if len(page_items) < GithubAPI.PER_PAGE:
+                return items
+            page += 1
+
+
+# Background pool for GitHub housekeeping so it overlaps with downloads.
+# Kept small because GitHub's secondary rate limits punish bursts.
+executor = ThreadPoolExecutor(max_workers=3)
+pending = []
+pending_lock = threading.Lock()
+
+
+def submit(func, *args):
+    future = executor.submit(func, *args)
+    with pending_lock:
+        pending.append(future)
+    return future
+
+
+def wait_for_housekeeping():
+    # Tasks may submit more tasks, so keep draining until nothing is left
+    while True:
+        with pending_lock:
+            futures = pending[:]
+            pending.clear()
+        if not futures:
+            return
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                silent_error(f"GitHub housekeeping failed: {e}")
+
 
 def load_cache():
     try:
         if is_running_in_github_actions():
-            workflow_status, completed_run_ids = get_latest_workflow_status()
-            
-            delete_completed_workflows(completed_run_ids)
+            workflow_status = get_latest_workflow_status()
+
+            # Runs in the background while the sources are downloaded
+            submit(delete_completed_workflows)
 
-            if workflow_status == 'success':
+            # After a failed run the journal can bring the cache up to date
+            if workflow_status == 'success' or os.path.exists(JOURNAL_FILE):
                 if os.path.exists(CACHE_FILE):
                     with open(CACHE_FILE, 'r') as file:
                         return json.load(file)
@@ -96,25 +164,30 @@ def extract_list_ids(rule):
     return set(ids_pattern.findall(rule['traffic']))
 
 
-def delete_completed_workflows(completed_run_ids):
-    if completed_run_ids:
-        for run_id in completed_run_ids:
-            delete_url = f"/repos/{GithubAPI.GITHUB_REPOSITORY}/actions/runs/{run_id}"
-            GithubAPI.delete(delete_url)
+def delete_completed_workflows(completed_run_ids=None):
+    RUNS_URL = f"/repos/{GithubAPI.GITHUB_REPOSITORY}/actions/runs"
 
+    if completed_run_ids is None:
+        runs = GithubAPI.get_all(f"{RUNS_URL}?status=completed", 'workflow_runs')
+        completed_run_ids = [run['id'] for run in runs]
 
-def get_latest_workflow_status():
-    WORKFLOW_RUNS_URL = f"/repos/{GithubAPI.GITHUB_REPOSITORY}/actions/runs?per_page=5"
+    for run_id in completed_run_ids:
+        submit(GithubAPI.delete, f"{RUNS_URL}/{run_id}")
 
-    runs_data = GithubAPI.get(WORKFLOW_RUNS_URL).get('workflow_runs', [])
-    completed_runs = [run for run in runs_data if run['status'] == 'completed']
 
-    if completed_runs:
-        latest_run = completed_runs[0]
-        completed_run_ids = [run['id'] for run in completed_runs]
-        return latest_run['conclusion'], completed_run_ids
+def get_latest_workflow_status():
+    WORKFLOW_RUNS_URL = f"/repos/{GithubAPI.GITHUB_REPOSITORY}/actions/runs?status=completed&per_page=1"
+
+    try:
+        runs_data = GithubAPI.get(WORKFLOW_RUNS_URL).get('workflow_runs', [])
+    except (HTTPException, OSError) as e:
+        # Without a known status the cache is treated as stale
+        silent_error(f"Failed to get latest workflow status: {e}")
+        return None
+    if runs_data:
+        return runs_data[0]['conclusion']
 
-    return None, []
+    return None
 
 
 def is_running_in_github_actions():
@@ -124,9 +197,16 @@ def is_running_in_github_actions():
 def delete_cache(completed_run_ids=None):
     CACHE_URL = f"/repos/{GithubAPI.GITHUB_REPOSITORY}/actions/caches"
 
-    caches = GithubAPI.get(CACHE_URL).get('actions_caches', [])
+    # Collect every page before deleting so pagination is not shifted
+    try:
+        caches = GithubAPI.get_all(CACHE_URL, 'actions_caches')
+    except (HTTPException, OSError) as e:
+        silent_error(f"Failed to list Actions caches: {e}")
+        caches = []
     for cache_id in [cache['id'] for cache in caches]:
-        GithubAPI.delete(f"{CACHE_URL}/{cache_id}")
+        submit(GithubAPI.delete, f"{CACHE_URL}/{cache_id}")
 
     if completed_run_ids:
         delete_completed_workflows(completed_run_ids)
+
+    wait_for_housekeeping()